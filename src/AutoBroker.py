@@ -1,20 +1,31 @@
-from typing import Set, Dict, List
-from datetime import datetime, timedelta
+from typing import Set, Dict, List, Tuple
+from datetime import date, datetime, timedelta
+from functools import lru_cache
 import logging
-import math
+import asyncio
 import json
 import time
+import os
 import pytz
 
-from ib_insync import *
+from ib_insync import IB, Contract, Stock, Order, Trade, util
+import numpy as np
 import pandas as pd
 
 
 SETTINGS_PATH = 'settings\\settings.json'
 TICKERS_PATH = 'settings\\tickers.xlsx'
 LOG_DIR = 'log\\'
+CACHE_DIR = 'cache\\'
 
-ib = IB()
+# Timezone of the exchanges, used to tell whether a session has closed
+EXCHANGE_TIMEZONE = 'US/Eastern'
+
+# TWS rejects more than 50 simultaneous historical data requests, keep
+# well below that
+MAX_HISTORICAL_REQUESTS = 16
+
+ib = None
 settings = dict()
 contracts = dict()
 historical_data = pd.DataFrame()
@@ -69,6 +80,48 @@ def connect():
         logging.error('Connecting to tws failed ' + str(e))
 
 
+def get_ib() -> IB:
+    """
+    Internal helper function.
+
+    Return the TWS connection stored in global ib. Nothing connects to
+    TWS at import time, the connection is made here on first use. Raise
+    ConnectionError if TWS can't be reached.
+    """
+
+    if not settings:
+        load_settings()
+
+    if ib is None or not ib.isConnected():
+        connect()
+
+        if not ib.isConnected():
+            raise ConnectionError(
+                f'Could not connect to TWS at {settings.get("TWS_ip")}:'
+                f'{settings.get("TWS_port")}')
+
+    return ib
+
+
+def add_missing_tickers(tickers: Set[str]):
+    """
+    Internal helper function.
+
+    Add a blank row to global portfolio for every ticker that is not in
+    it yet. The portfolio is only reindexed if rows are missing.
+
+    tickers -- set of ticker symbols
+    """
+
+    global portfolio
+
+    missing_tickers = tickers.difference(portfolio.index)
+
+    if missing_tickers:
+        portfolio = portfolio.reindex(
+            portfolio.index.union(list(missing_tickers)))
+
+
 def get_tickers(path: str = TICKERS_PATH) -> Set[str]:
     """
     Get ticker symbols from an excel sheet. Return ticker symbols as a set
@@ -77,36 +130,186 @@ def get_tickers(path: str = TICKERS_PATH) -> Set[str]:
     path -- path to excel sheet
     """
 
-    sheet_data = pd.read_excel(path, skipna=True, header=None)
+    # Tickers are only in the first column, don't parse the rest
+    sheet_data = pd.read_excel(path, header=None, usecols=[0],
+                               dtype=str, engine='openpyxl')
 
     ticker_series = sheet_data.iloc[:, 0].dropna()
 
     tickers = set(ticker_series)
 
     # If tickers are not in portfolio, add them
-    global portfolio
-    missing_tickers = list(tickers - set(portfolio.index))
-    portfolio = portfolio.reindex(portfolio.index.union(missing_tickers))
+    add_missing_tickers(tickers)
 
     logging.info(f'Ticker list: {tickers}')
 
-    # Generate all contracts
+    # Generate all contracts and qualify them together, the per-ticker
+    # contract detail requests to TWS then run concurrently
     global contracts
-    for ticker in tickers:
-        contract = Stock(ticker, 'SMART', 'USD')
-        ib.qualifyContracts(contract)
-        contracts[ticker] = contract
+    new_contracts = {ticker: Stock(ticker, 'SMART', 'USD')
+                     for ticker in tickers}
+    ib = get_ib()
+    ib.qualifyContracts(*new_contracts.values())
+    contracts.update(new_contracts)
 
     return tickers
 
 
+def completed_session(now: datetime = None) -> date:
+    """
+    Internal helper function.
+
+    Return the date of the latest trading session that has closed.
+    Exchange holidays are not known, on the day after a holiday cached
+    bars just look stale and are pulled again.
+
+    now -- current time on the exchange, defaults to the current time
+    """
+
+    if now is None:
+        now = datetime.now(pytz.timezone(EXCHANGE_TIMEZONE))
+
+    day = pd.Timestamp(now.date())
+
+    if day.weekday() >= 5 or (now.hour, now.minute) < (16, 0):
+        day = day - pd.offsets.BDay(1)
+
+    return day.date()
+
+
+def load_cache(tickers: Set[str], columns: List[str] = None,
+               session: date = None) -> Dict[str, pd.DataFrame]:
+    """
+    Load cached daily bars from the cache directory. Only tickers in
+    tickers whose cached bars end on the latest completed session are
+    loaded. Return dict of ticker symbols mapped to DataFrames of daily
+    bars.
+
+    tickers -- set of ticker symbols
+    columns -- bar fields to read, all fields are read if None
+    session -- date of the latest completed session, defaults to
+               completed_session()
+    """
+
+    cached = dict()
+
+    if not os.path.isdir(CACHE_DIR):
+        return cached
+
+    if session is None:
+        session = completed_session()
+
+    # The date is needed to check freshness
+    if columns is not None and 'date' not in columns:
+        columns = ['date'] + list(columns)
+
+    with os.scandir(CACHE_DIR) as entries:
+        for entry in entries:
+            ticker, extension = os.path.splitext(entry.name)
+
+            if extension != '.parquet' or ticker not in tickers:
+                continue
+
+            try:
+                data = pd.read_parquet(entry.path, engine='pyarrow',
+                                       columns=columns)
+            except Exception as e:
+                logging.error(f'Reading cache for {ticker} failed ' + str(e))
+                continue
+
+            if data.empty or \
+                    pd.Timestamp(data['date'].iloc[-1]).date() != session:
+                continue
+
+            cached[ticker] = data
+
+    return cached
+
+
+def save_cache(bars: Dict[str, pd.DataFrame]):
+    """
+    Write daily bars to the cache directory, one parquet file per ticker.
+    Only the tickers in bars are written, the rest of the cache is left
+    untouched. Bars must only cover completed sessions.
+
+    bars -- dict of ticker symbols mapped to DataFrames of daily bars
+    """
+
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+    except Exception as e:
+        logging.error('Creating cache directory failed ' + str(e))
+        return
+
+    for ticker, data in bars.items():
+        try:
+            data.to_parquet(CACHE_DIR + ticker + '.parquet',
+                            engine='pyarrow', compression='snappy',
+                            index=False)
+        except Exception as e:
+            logging.error(f'Writing cache for {ticker} failed ' + str(e))
+
+
+async def request_bars(contracts: List[Contract]) -> List[list]:
+    """
+    Internal helper function.
+
+    Request two years of daily bars for each contract, at most
+    MAX_HISTORICAL_REQUESTS at a time. Return list of bar lists in the
+    same order as contracts.
+
+    contracts -- list of qualified Contract objects
+    """
+
+    ib = get_ib()
+    semaphore = asyncio.Semaphore(MAX_HISTORICAL_REQUESTS)
+
+    # There's room for optimization here. We need 53 weeks of data but
+    # all duration strings greater than a year must be defined in terms
+    # of years. A '1 Y' durationStr only gives 52 weeks of data not the
+    # needed 53, so we request '2 Y' of data and trim what we don't
+    # need. If execution time is ever an issue this could be optimized
+    # by requesting first '1 Y' of data then '1 W' of data seperately
+
+    async def request(contract: Contract) -> list:
+        async with semaphore:
+            return await ib.reqHistoricalDataAsync(
+                contract=contract,
+                endDateTime='',
+                durationStr='2 Y',
+                barSizeSetting='1 day',
+                whatToShow='ADJUSTED_LAST',
+                useRTH=True
+            )
+
+    return await asyncio.gather(*(request(c) for c in contracts))
+
+
+@lru_cache(maxsize=4)
+def week_schedule(last_day: date) -> pd.DatetimeIndex:
+    """
+    Internal helper function.
+
+    Get the dates of the last 53 weeks ending on last_day, one week
+    apart. The schedule only changes with the last trading day, so it is
+    memoized.
+
+    last_day -- date of the last bar in the data pull
+    """
+
+    return pd.date_range(end=last_day, periods=53, freq='7D')
+
+
 def get_historical_data(cont: Dict[str, Contract] = None) -> pd.DataFrame:
     """
     Get weekly historical data for all contracts going back 53 weeks.
+    Only completed sessions are used. Daily bars are read from the
+    cache where possible, only tickers with a missing or stale cache
+    are pulled from TWS.
 
     Sore result in DataFrame which is returned and stored in global
-    historical_data. The index of this dataframe is a string
-    representation of a datetime.date object, the column names are the
+    historical_data. The index of this dataframe is a DatetimeIndex of
+    the sampled trading days, the column names are the
     ticker symbols and the data is the close value of the ticker as a
     float.
 
@@ -124,69 +327,119 @@ def get_historical_data(cont: Dict[str, Contract] = None) -> pd.DataFrame:
 
     start = time.time()
 
-    data_pull = pd.DataFrame()
+    session = completed_session()
+
+    # Only the close is used, parquet skips the other columns on read
+    bars = load_cache(set(contracts.keys()), columns=['date', 'close'],
+                      session=session)
+    pulled = dict()
+
+    logging.info(f'Loaded {len(bars)} tickers from cache')
 
     # Get historical data from ib api
-    # There's room for optimization here. We need 53 weeks of data but
-    # all duration strings greater than a year must be defined in terms
-    # of years. A '1 Y' durationStr only gives 52 weeks of data not the
-    # needed 53, so we request '2 Y' of data and trim what we don't
-    # need. If execution time is ever an issue this could be optimized
-    # by requesting first '1 Y' of data then '1 W' of data seperately
-    for ticker in contracts.keys():
-        bars = ib.reqHistoricalData(
-            contract=contracts[ticker],
-            endDateTime='',
-            durationStr='2 Y',
-            barSizeSetting='1 day',
-            whatToShow='ADJUSTED_LAST',
-            useRTH=True
-        )
-
-        for bar in bars:
-            data_pull.loc[bar.date, ticker] = bar.close
+    # Requests are sent concurrently over the TWS connection instead of
+    # waiting on each ticker in turn
+    stale_tickers = [t for t in contracts.keys() if t not in bars]
+
+    if stale_tickers:
+        requests = request_bars([contracts[t] for t in stale_tickers])
+        results = get_ib().run(requests)
+    else:
+        results = list()
+
+    for ticker, ticker_bars in zip(stale_tickers, results):
+        if not ticker_bars:
+            logging.error(f'No historical data received for {ticker}')
+            continue
+
+        # Drop the bar of a session still in progress, its close is not
+        # final. Cached tickers end on the completed session too, so all
+        # tickers line up on the same last day
+        data = util.df(ticker_bars)
+        pulled[ticker] = data[pd.to_datetime(data['date']) <=
+                              pd.Timestamp(session)]
+
+    save_cache(pulled)
+    bars.update(pulled)
+
+    closes = {ticker: pd.Series(data['close'].to_numpy(),
+                                index=pd.to_datetime(data['date']))
+              for ticker, data in bars.items()}
+
+    # Build the frame once, growing it a cell at a time reallocates
+    # the whole frame for every new date
+    data_pull = pd.DataFrame(closes).sort_index()
 
     end = time.time()
     logging.info(f'Data pull took {end-start} seconds')
 
-    cur_weekday = data_pull.index[-1].weekday()  # last weekday in datapull
-    weekday_dates = list(filter(lambda d: d.weekday() ==
-                                cur_weekday, data_pull.index))[-53:]
-    historical_data = data_pull.loc[weekday_dates]
+    # Fill gaps (days a ticker did not trade) with the previous close.
+    # Weeks before a ticker was listed stay NaN and are skipped by the
+    # sharpe calculation
+    data_pull = data_pull.ffill()
 
-    for ticker, data in historical_data.items():
-        for date, value in data.items():
-            while math.isnan(value):
-                previous_date = date - timedelta(days=1)
-                try:
-                    value = data_pull[ticker][previous_date]
-                except KeyError:
-                    next_date = date + timedelta(days=1)
-                    value = data_pull[ticker][next_date]
-
-                historical_data[ticker][date] = value
+    # Sample the weekday of the last bar in the pull for the last 53
+    # weeks. If that day has no bar (holiday) the previous close is used
+    week_dates = week_schedule(data_pull.index[-1].date())
+    historical_data = data_pull.reindex(week_dates, method='ffill')
 
     return historical_data
 
 
-def sharpe_single(ticker_change: pd.Series, weeks: int = 52) -> float:
+def sharpe_single(change: np.ndarray, weeks: int = 52) -> np.ndarray:
     """
-    Get the sharpe ratio of a single ticker going over a certain number
-    of weeks
+    Get the sharpe ratio of each ticker going over a certain number of
+    weeks. Return array with one sharpe ratio per column of change.
 
-    ticker_change -- a Series object containting change percentages
+    change -- array of change percentages, one row per week and one
+              column per ticker
     weeks -- number of weeks to take into account, most recent weeks
              will be uesed
     """
 
-    total_weeks = len(ticker_change.index)
-    change = ticker_change[total_weeks-weeks: total_weeks]
+    return window_sharpes(change, [weeks])[0]
+
+
+def window_sharpes(change: np.ndarray, windows: List[int]) -> np.ndarray:
+    """
+    Get the sharpe ratio of each ticker over several windows of weeks at
+    once. Return array with one row per window and one column per
+    ticker.
+
+    change -- array of change percentages, one row per week and one
+              column per ticker
+    windows -- numbers of weeks to take into account, most recent weeks
+               will be used
+    """
+
+    # One row per window selecting its most recent weeks, so the count
+    # and sum of every window are each one matrix product
+    total_weeks = len(change)
+    window_starts = total_weeks - np.array(windows)[:, np.newaxis]
+    masks = (np.arange(total_weeks) >= window_starts).astype(float)
+
+    valid = ~np.isnan(change)
+    values = np.where(valid, change, 0)
+
+    count = masks @ valid
+    total = masks @ values
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        average = total / count
 
-    average = change.mean(skipna=True)
+        # Second pass for the variance, deviations from each window's own
+        # average. The one-pass sum of squares cancels badly when weekly
+        # changes are nearly constant
+        deviations = np.where(valid, values - average[:, np.newaxis], 0)
+        variance = np.einsum('kn,kn...->k...', masks, deviations ** 2)
+        standard_deviation = np.sqrt(variance / count)
 
-    standard_deviation = change.std(skipna=True, ddof=0)
+        # Rounding leaves a tiny spread on changes that never vary. The
+        # sharpe ratio is undefined without variation, so it is NaN
+        standard_deviation[standard_deviation <= 1e-8 * np.abs(average)] = \
+            np.nan
 
-    return average / standard_deviation
+        return average / standard_deviation
 
 
 def sharpe_ratios(weekly_data: pd.DataFrame = None) -> Dict[str, float]:
@@ -207,33 +460,26 @@ def sharpe_ratios(weekly_data: pd.DataFrame = None) -> Dict[str, float]:
 
     weekly_change = weekly_data.pct_change()
 
-    tickers = set(weekly_change.columns)
-
-    sharpes = dict()
+    tickers = list(weekly_change.columns)
 
     # if tickers are not in portfolio, add them
     global portfolio
-    missing_tickers = list(tickers - set(portfolio.index))
-    portfolio = portfolio.reindex(portfolio.index.union(missing_tickers))
-
-    for ticker in tickers:
-        ticker_change = weekly_change[ticker]
+    add_missing_tickers(set(tickers))
 
-        # Calculate sharpe ratios for ticker
-        sharpe_52 = sharpe_single(ticker_change, 52)
-        sharpe_26 = sharpe_single(ticker_change, 26)
-        sharpe_13 = sharpe_single(ticker_change, 13)
+    # Calculate sharpe ratios for all tickers at once, one column per
+    # ticker
+    change = weekly_change.to_numpy(dtype=float)
 
-        average = (sharpe_52 + sharpe_26 + sharpe_13) / 3
-        adjusted = average ** 1.5 if average > 0.2 else 0
+    sharpe_52, sharpe_26, sharpe_13 = window_sharpes(change, [52, 26, 13])
 
-        sharpes[ticker] = average
+    average = (sharpe_52 + sharpe_26 + sharpe_13) / 3
+    adjusted = np.where(average > 0.2, np.abs(average) ** 1.5, 0)
 
-        # Update portfolio
-        portfolio.loc[ticker]['Sharpe (unadjusted)'] = average
-        portfolio.loc[ticker]['Sharpe (adjusted)'] = adjusted
+    # Update portfolio
+    portfolio.loc[tickers, 'Sharpe (unadjusted)'] = average
+    portfolio.loc[tickers, 'Sharpe (adjusted)'] = adjusted
 
-    return sharpes
+    return dict(zip(tickers, average.tolist()))
 
 
 def get_prices(cont: Dict[str, Contract] = None) -> Dict[str, float]:
@@ -254,6 +500,7 @@ def get_prices(cont: Dict[str, Contract] = None) -> Dict[str, float]:
     global portfolio
     prices = dict()
 
+    ib = get_ib()
     ib.reqTickers(*list(contracts.values()))
 
     for symbol, contract in contracts.items():
@@ -276,6 +523,8 @@ def actual_portfolio():
     global settings
     account = settings['TWS_account']
 
+    ib = get_ib()
+
     if not account:
         account_value = [v for v in ib.accountValues()
                          if v.tag == 'NetLiquidation'][0]
@@ -290,25 +539,34 @@ def actual_portfolio():
     global contracts
     global portfolio
 
-    for position in ib.positions(account):
+    positions = ib.positions(account)
+
+    # Add rows for all held tickers at once rather than one at a time
+    add_missing_tickers({p.contract.symbol for p in positions})
+
+    tickers = list()
+    rows = list()
+
+    for position in positions:
         ticker = position.contract.symbol
         count = position.position
         price = position.avgCost
         value = price * count
 
-        if ticker not in portfolio.index:
-            portfolio.loc[ticker] = None
-
         contracts[ticker] = position.contract
-        portfolio.loc[ticker]['Actual (cnt)'] = round(count, 2)
-        portfolio.loc[ticker]['Price'] = price
-        portfolio.loc[ticker]['Actual ($)'] = round(value, 2)
-        portfolio.loc[ticker]['Actual (%)'] = (value / portfolio_value) * 100
+        tickers.append(ticker)
+        rows.append([round(count, 2), price, round(value, 2),
+                     (value / portfolio_value) * 100])
+
+    # Write all positions at once. Chained portfolio.loc[ticker][column]
+    # assignments write to a temporary copy and are silently lost
+    if rows:
+        portfolio.loc[tickers, ['Actual (cnt)', 'Price', 'Actual ($)',
+                                'Actual (%)']] = rows
 
     # Fill blank values with zeros
-    portfolio['Actual (cnt)'].fillna(0, inplace=True)
-    portfolio['Actual ($)'].fillna(0, inplace=True)
-    portfolio['Actual (%)'].fillna(0, inplace=True)
+    actual_columns = ['Actual (cnt)', 'Actual ($)', 'Actual (%)']
+    portfolio[actual_columns] = portfolio[actual_columns].fillna(0)
 
 
 def target_portfolio():
@@ -336,9 +594,17 @@ def target_portfolio():
     # If target is over 25%, store here by how much
     target_excess = 0
 
-    # Populate portfolio dataframe
-    for ticker, row in portfolio.iterrows():
-        target_percentage = row['Sharpe (adjusted)'] / sum_sharpe
+    adjusted_sharpes = portfolio['Sharpe (adjusted)'].to_numpy(dtype=float)
+    prices = portfolio['Price'].to_numpy()
+
+    # Fill plain arrays and write them to the portfolio dataframe once,
+    # instead of three .loc writes per ticker
+    target_percentages = np.empty(len(portfolio))
+    target_values = np.empty(len(portfolio))
+    target_cnts = np.full(len(portfolio), np.nan)
+
+    for i, ticker in enumerate(portfolio.index):
+        target_percentage = adjusted_sharpes[i] / sum_sharpe
         target_percentage = target_percentage + target_excess
 
         if target_percentage > 25:
@@ -346,15 +612,18 @@ def target_portfolio():
             target_percentage = 25
 
         target_value = target_percentage * portfolio_value
-        if row['Price']:
-            target_cnt = target_value / row['Price']
+        if prices[i]:
+            target_cnts[i] = target_value / prices[i]
         else:
             logging.error(f'{ticker} excluded from target portfolio')
-            target_cnt = None
 
-        portfolio.loc[ticker, 'Target (%)'] = target_percentage * 100
-        portfolio.loc[ticker, 'Target ($)'] = target_value
-        portfolio.loc[ticker, 'Target (cnt)'] = target_cnt
+        target_percentages[i] = target_percentage * 100
+        target_values[i] = target_value
+
+    # Populate portfolio dataframe
+    portfolio['Target (%)'] = target_percentages
+    portfolio['Target ($)'] = target_values
+    portfolio['Target (cnt)'] = target_cnts
 
     logging.info(f'Total portfolio value: {portfolio_value}')
     logging.info('Portfolio:\n' + str(portfolio))
@@ -381,7 +650,6 @@ def generate_sell_orders():
         # target portfolio is more than 2%
         if row['Actual (%)'] - row['Target (%)'] > 2:
             contract = Stock(ticker, 'SMART', 'USD')
-            ib.qualifyContracts(contract)
 
             if row['Target (cnt)'] == 0:
                 number = row['Actual (cnt)']
@@ -398,6 +666,9 @@ def generate_sell_orders():
 
             sell_orders.append((contract, order))
 
+    ib = get_ib()
+    ib.qualifyContracts(*[contract for contract, _ in sell_orders])
+
     return sell_orders
 
 
@@ -417,6 +688,28 @@ def trades_complete(trades: List[Trade]) -> bool:
     return True
 
 
+def split_trades(trades: List[Trade]) -> Tuple[List[Trade], List[Trade]]:
+    """
+    Internal helper function.
+
+    Split trades into complete and incomplete trades in one pass. Return
+    tuple of list of complete trades and list of incomplete trades
+
+    trades -- list of Trade objects
+    """
+
+    complete_trades = list()
+    incomplete_trades = list()
+
+    for trade in trades:
+        if trade.isDone():
+            complete_trades.append(trade)
+        else:
+            incomplete_trades.append(trade)
+
+    return complete_trades, incomplete_trades
+
+
 def execute_sell_orders():
     """
     Execute all sell orders in global sell_orders. Wait for one of the
@@ -450,6 +743,7 @@ def execute_sell_orders():
         amount = order[1].totalQuantity
         logging.info(f'selling {amount} shares of {ticker}')
 
+    ib = get_ib()
     trades = [ib.placeOrder(*order) for order in sell_orders]
 
     submit_time = datetime.now(timezone)
@@ -489,7 +783,8 @@ def execute_sell_orders():
 
     # If cutoff time was reached and orders are still incomplete
     if status == 'REVISE':
-        incomplete_trades = [t for t in trades if not t.isDone()]
+        # Keep completed trades, incomplete ones are replaced below
+        trades, incomplete_trades = split_trades(trades)
 
         new_trades = list()
 
@@ -500,9 +795,8 @@ def execute_sell_orders():
 
             logging.info(f'resubmitting sell order for {contract.symbol}')
 
-            # Cancel incomplete oreders and remove them from trades
+            # Cancel incomplete oreders
             ib.cancelOrder(trade.order)
-            trades.remove(trade)
 
             # Create new orders of auxiliary sell type
             new_trade = ib.placeOrder(contract, order)
@@ -542,7 +836,6 @@ def generate_buy_orders():
     for ticker, row in portfolio.iterrows():
         if row['Target (%)'] - row['Actual (%)'] > 2:
             contract = Stock(ticker, 'SMART', 'USD')
-            ib.qualifyContracts(contract)
 
             number = row['Target (cnt)'] - row['Actual (cnt)']
             number = number - (number % r)  # Round down
@@ -552,6 +845,9 @@ def generate_buy_orders():
 
             buy_orders.append((contract, order))
 
+    ib = get_ib()
+    ib.qualifyContracts(*[contract for contract, _ in buy_orders])
+
     return buy_orders
 
 
@@ -585,6 +881,7 @@ def execute_buy_orders():
         amount = order[1].totalQuantity
         logging.info(f'buying {amount} shares of {ticker}')
 
+    ib = get_ib()
     trades = [ib.placeOrder(*order) for order in buy_orders]
 
     submit_time = datetime.now(timezone)
@@ -624,7 +921,8 @@ def execute_buy_orders():
         time.sleep(.5)
 
     if status == 'REVISE':
-        incomplete_trades = [t for t in trades if not t.isDone()]
+        # Keep completed trades, incomplete ones are replaced below
+        trades, incomplete_trades = split_trades(trades)
 
         new_trades = list()
 
@@ -634,7 +932,6 @@ def execute_buy_orders():
                           totalQuantity=trade.remaining())
 
             ib.cancelOrder(trade.order)
-            trades.remove(trade)
 
             logging.info(f'resubmitting sell order for {contract.symbol}')
 
@@ -1,7 +1,12 @@
 import unittest
+import asyncio
+import tempfile
 import math
-from datetime import datetime, timedelta
+import os
+from datetime import datetime
 
+from ib_insync import BarData
+import numpy as np
 import pandas as pd
 
 from autobroker import AutoBroker
@@ -19,21 +24,148 @@ def get_expected_results():
 
 
 def get_weekly_data(daily_data):
-    daily_data = daily_data.iloc[::-1]
+    """ Sample daily data the same way AutoBroker.get_historical_data does """
+    daily_data = daily_data.iloc[::-1].ffill()
 
-    cur_weekday = daily_data.index[-1].weekday()  # last weekday in datapull
-    weekday_dates = list(filter(lambda d: d.weekday() ==
-                                cur_weekday, daily_data.index))[-53:]
-    historical_data = daily_data.loc[weekday_dates]
+    week_dates = AutoBroker.week_schedule(daily_data.index[-1].date())
 
-    for ticker, data in historical_data.items():
-        for date, value in data.items():
-            while math.isnan(value):
-                previous_date = date - timedelta(days=1)
-                value = daily_data[ticker][previous_date]
-                historical_data[ticker][date] = value
+    return daily_data.reindex(week_dates, method='ffill')
 
-    return historical_data
+
+def get_daily_bars(start, end, holidays=()):
+    """ Daily bars on business days from start to end, close counts up """
+    days = pd.bdate_range(start, end).drop(pd.to_datetime(list(holidays)))
+    return [BarData(date=day.date(), close=100.0 + i)
+            for i, day in enumerate(days)]
+
+
+class FakeIB:
+    """ Stands in for the TWS connection, serving canned daily bars """
+
+    def __init__(self, bars):
+        self.bars = bars
+
+    def isConnected(self):
+        return True
+
+    def run(self, awaitable):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(awaitable)
+        finally:
+            loop.close()
+
+    async def reqHistoricalDataAsync(self, contract, **kwargs):
+        return self.bars[contract]
+
+
+class TestHistoricalData(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        AutoBroker.CACHE_DIR = self.cache_dir.name + os.sep
+        AutoBroker.settings = {'max_portfolio_size': 13}
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def get_historical_data(self, bars):
+        AutoBroker.ib = FakeIB(bars)
+        return AutoBroker.get_historical_data({t: t for t in bars})
+
+    def test_late_listing(self):
+        weekly_data = self.get_historical_data({
+            'OLD': get_daily_bars('2023-01-02', '2024-07-11'),
+            'NEW': get_daily_bars('2024-03-04', '2024-07-11')
+        })
+
+        listed = weekly_data.index >= pd.Timestamp('2024-03-04')
+
+        # Weeks before the listing must not be back-filled with the
+        # first close, that would add flat 0% weeks
+        self.assertTrue(weekly_data.loc[~listed, 'NEW'].isna().all())
+        self.assertFalse(weekly_data.loc[listed, 'NEW'].isna().any())
+        self.assertFalse(weekly_data['OLD'].isna().any())
+
+        change = weekly_data['NEW'].pct_change().dropna()
+        self.assertFalse((change == 0).any())
+
+    def test_holiday(self):
+        bars = get_daily_bars('2023-01-02', '2024-07-11',
+                              holidays=['2024-07-04'])
+        weekly_data = self.get_historical_data({'AAA': bars})
+
+        closes = {pd.Timestamp(bar.date): bar.close for bar in bars}
+
+        # 53 weeks sampled on the weekday of the last bar
+        self.assertEqual(len(weekly_data), 53)
+        self.assertEqual(weekly_data.index[-1], pd.Timestamp('2024-07-11'))
+        self.assertTrue((weekly_data.index.weekday == 3).all())
+
+        # The holiday week takes the close of the day before
+        self.assertEqual(weekly_data.loc['2024-07-04', 'AAA'],
+                         closes[pd.Timestamp('2024-07-03')])
+        self.assertEqual(weekly_data.loc['2024-06-27', 'AAA'],
+                         closes[pd.Timestamp('2024-06-27')])
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        AutoBroker.CACHE_DIR = self.cache_dir.name + os.sep
+
+        days = pd.bdate_range('2024-07-01', '2024-07-10')
+        self.bars = pd.DataFrame({
+            'date': [day.date() for day in days],
+            'open': [1.0] * len(days),
+            'close': [2.0] * len(days)
+        })
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def test_completed_session(self):
+        cases = {
+            datetime(2024, 7, 10, 15, 59): '2024-07-09',  # market open
+            datetime(2024, 7, 10, 16, 0): '2024-07-10',   # after close
+            datetime(2024, 7, 13, 12, 0): '2024-07-12',   # saturday
+            datetime(2024, 7, 15, 9, 0): '2024-07-12',    # monday morning
+        }
+
+        for now, expected in cases.items():
+            self.assertEqual(AutoBroker.completed_session(now),
+                             pd.Timestamp(expected).date())
+
+    def test_round_trip(self):
+        AutoBroker.save_cache({'AAA': self.bars})
+
+        cached = AutoBroker.load_cache({'AAA', 'BBB'},
+                                       session=self.bars['date'].iloc[-1])
+
+        self.assertEqual(list(cached), ['AAA'])
+        pd.testing.assert_frame_equal(cached['AAA'], self.bars)
+
+    def test_column_projection(self):
+        AutoBroker.save_cache({'AAA': self.bars})
+
+        cached = AutoBroker.load_cache({'AAA'}, columns=['close'],
+                                       session=self.bars['date'].iloc[-1])
+
+        self.assertEqual(list(cached['AAA'].columns), ['date', 'close'])
+
+    def test_stale(self):
+        AutoBroker.save_cache({'AAA': self.bars})
+
+        # A newer session has closed since the bars were cached
+        cached = AutoBroker.load_cache(
+            {'AAA'}, session=pd.Timestamp('2024-07-11').date())
+
+        self.assertEqual(cached, dict())
+
+    def test_write_error(self):
+        bad_bars = pd.DataFrame({'date': [object()]})
+
+        with self.assertLogs(level='ERROR'):
+            AutoBroker.save_cache({'AAA': bad_bars})
 
 
 class TestSharpe(unittest.TestCase):
@@ -54,6 +186,21 @@ class TestSharpe(unittest.TestCase):
                 msg=(f'{ticker} sharpe: {sharpe} expected: {expected} '
                      f'difference: {abs(sharpe - expected)}'))
 
+    def test_constant_change(self):
+        self.addCleanup(setattr, AutoBroker, 'portfolio',
+                        AutoBroker.portfolio)
+
+        # Closes growing exactly 1% a week have no variation, the sharpe
+        # ratio must not blow up from rounding
+        closes = 100 * 1.01 ** np.arange(53)
+        weekly_data = pd.DataFrame({'FLAT': closes})
+
+        sharpes = AutoBroker.sharpe_ratios(weekly_data)
+
+        self.assertTrue(math.isnan(sharpes['FLAT']))
+        self.assertEqual(AutoBroker.portfolio.loc['FLAT',
+                                                  'Sharpe (adjusted)'], 0)
+
     def test_target_share(self):
         AutoBroker.settings = {'max_portfolio_size': 13}
         AutoBroker.historical_data = self.weekly_data